@@ -3,10 +3,25 @@
 
 import yaml
 import json
+import pickle
 import sys
 import argparse
 from pathlib import Path
-from collections import defaultdict
+from collections import Counter, defaultdict
+from functools import lru_cache
+from operator import attrgetter
+
+# orjson (опционально) сериализует JSON в разы быстрее стандартного json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# libyaml (C) заметно быстрее чистого Python загрузчика
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
 
 # Настройка кодировки для Windows
 if sys.platform == 'win32':
@@ -21,6 +36,7 @@ class CraftingGraph:
         self.item_to_producers = defaultdict(list)  # item_name -> [recipe_ids]
         self.item_to_consumers = defaultdict(list)  # item_name -> [recipe_ids]
         self.recipe_id_map = {}  # recipe_id -> recipe object
+        self.successors = []  # recipe_id -> [recipe_ids], потребляющие его output
 
         self._build_graph(recipes_data)
 
@@ -31,13 +47,20 @@ class CraftingGraph:
         for station_name, station in recipes_data.items():
             for level, level_data in station.get('levels', {}).items():
                 for recipe in level_data.get('recipes', []):
+                    duration = recipe.get('duration', 0)
+                    has_range = isinstance(duration, dict)
+
                     recipe_obj = {
                         'id': recipe_id,
                         'station': station_name,
                         'level': level,
                         'inputs': recipe['inputs'],
                         'output': recipe['output'],
-                        'duration': recipe.get('duration', 0),
+                        'duration': duration,
+                        # Нормализованный диапазон: одиночное значение -> (X, X)
+                        'duration_min': duration['min'] if has_range else duration,
+                        'duration_max': duration['max'] if has_range else duration,
+                        'has_range': has_range,
                         'requirements': recipe.get('requirements', [])
                     }
 
@@ -45,63 +68,174 @@ class CraftingGraph:
                     self.recipe_id_map[recipe_id] = recipe_obj
 
                     # Индекс: что производит
-                    output_name = recipe['output']['name']
+                    # (имена интернируются: один объект str на предмет во всех индексах)
+                    output_name = sys.intern(recipe['output']['name'])
                     self.item_to_producers[output_name].append(recipe_id)
+                    recipe_obj['_produced'] = Counter({output_name: recipe['output']['quantity']})
 
                     # Индекс: что потребляет (игнорируем инструменты)
+                    consumed = Counter()
                     for input_item in recipe['inputs']:
                         if not input_item.get('consumable', True):
                             continue  # Пропускаем инструменты
 
-                        input_name = input_item['name']
+                        input_name = sys.intern(input_item['name'])
                         self.item_to_consumers[input_name].append(recipe_id)
+                        consumed[input_name] += input_item['quantity']
+                    recipe_obj['_consumed'] = consumed
 
-                    recipe_id += 1
-
-    def find_all_cycles(self, max_length=10, min_length=2):
-        """Находит все циклы длиной от min_length до max_length"""
-        cycles = []
-        visited_in_path = set()
-
-        def dfs(recipe_id, path):
-            if recipe_id in path:
-                # Найден цикл!
-                cycle_start_idx = path.index(recipe_id)
-                cycle = path[cycle_start_idx:]
-
-                # Проверка длины
-                if len(cycle) < min_length:
-                    return
+                    # Чистый вклад рецепта в баланс цикла (выход - вход)
+                    delta = Counter(recipe_obj['_produced'])
+                    delta.subtract(consumed)
+                    recipe_obj['_delta'] = delta
 
-                # Нормализуем (начинаем с минимального ID)
-                min_idx = cycle.index(min(cycle))
-                normalized = tuple(cycle[min_idx:] + cycle[:min_idx])
-
-                if normalized not in cycles:
-                    cycles.append(normalized)
-                return
-
-            if recipe_id in visited_in_path or len(path) >= max_length:
-                return
+                    recipe_id += 1
 
-            visited_in_path.add(recipe_id)
-            path.append(recipe_id)
+        # Рёбра графа: рецепт -> рецепты, потребляющие его output
+        self.successors = [
+            self.item_to_consumers.get(recipe['output']['name'], [])
+            for recipe in self.recipes
+        ]
 
-            # Получаем рецепты, потребляющие output текущего рецепта
-            recipe = self.recipe_id_map[recipe_id]
-            output_name = recipe['output']['name']
+    @staticmethod
+    def _strongly_connected_components(succ, vertices, roots=None):
+        """
+        Компоненты сильной связности подграфа на вершинах vertices.
+        Итеративный алгоритм Тарьяна (без рекурсии).
 
-            for next_recipe_id in self.item_to_consumers.get(output_name, []):
-                dfs(next_recipe_id, path[:])  # Копируем путь
+        roots - вершины, с которых запускается обход (по умолчанию все);
+        тогда возвращаются только компоненты, достижимые из них.
+        """
+        index = {}
+        lowlink = {}
+        stack = []
+        on_stack = set()
+        components = []
+
+        for root in vertices if roots is None else roots:
+            if root in index:
+                continue
+
+            index[root] = lowlink[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            work = [(root, iter(succ[root]))]
+
+            while work:
+                v, neighbors = work[-1]
+                for w in neighbors:
+                    if w not in vertices:
+                        continue
+                    if w not in index:
+                        # Спускаемся в w, итератор v продолжим позже
+                        index[w] = lowlink[w] = len(index)
+                        stack.append(w)
+                        on_stack.add(w)
+                        work.append((w, iter(succ[w])))
+                        break
+                    if w in on_stack:
+                        lowlink[v] = min(lowlink[v], index[w])
+                else:
+                    # Все соседи v обработаны
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[parent] = min(lowlink[parent], lowlink[v])
+
+                    if lowlink[v] == index[v]:
+                        component = []
+                        while True:
+                            w = stack.pop()
+                            on_stack.discard(w)
+                            component.append(w)
+                            if w == v:
+                                break
+                        components.append(component)
+
+        return components
 
-            visited_in_path.remove(recipe_id)
+    def find_all_cycles(self, max_length=10, min_length=2):
+        """
+        Находит все циклы длиной от min_length до max_length.
 
-        # Запускаем DFS от каждого рецепта
-        for recipe_id in range(len(self.recipes)):
-            visited_in_path.clear()
-            dfs(recipe_id, [])
+        Алгоритм Джонсона: циклы перечисляются только внутри нетривиальных
+        компонент сильной связности, каждый элементарный цикл - ровно один раз.
+        """
+        succ = self.successors
+        cycles = set()
+        all_vertices = set(range(len(self.recipes)))
+
+        for component in self._strongly_connected_components(succ, all_vertices):
+            # Одиночный рецепт без петли не может быть в цикле
+            if len(component) == 1 and component[0] not in succ[component[0]]:
+                continue
+
+            # Рёбра, ведущие из компоненты, в цикл не входят - отбрасываем их один раз
+            members = set(component)
+            local_succ = {v: [w for w in succ[v] if w in members] for v in component}
+
+            for start in sorted(component):
+                # Циклы через меньшие ID уже найдены на предыдущих шагах.
+                # Без них компонента может распасться: оставляем только
+                # компоненту start (последняя, найденная обходом из start)
+                remaining = {v for v in component if v >= start}
+                start_component = set(self._strongly_connected_components(
+                    local_succ, remaining, roots=[start]
+                )[-1])
+                if len(start_component) == 1 and start not in local_succ[start]:
+                    continue
 
-        return cycles
+                adjacency = {
+                    v: [w for w in local_succ[v] if w in start_component]
+                    for v in start_component
+                }
+                blocked = {start}
+                blocked_by = defaultdict(set)  # B-списки Джонсона
+                path = [start]
+                # Явный стек вместо рекурсии: [вершина, итератор соседей, найден ли цикл]
+                stack = [[start, iter(adjacency[start]), False]]
+
+                while stack:
+                    frame = stack[-1]
+                    for w in frame[1]:
+                        if w == start:
+                            # Найден цикл!
+                            # start - минимальный ID цикла, путь уже нормализован.
+                            # set убирает повторы от дублирующихся рёбер
+                            # (предмет указан во входах рецепта дважды)
+                            if min_length <= len(path) <= max_length:
+                                cycles.add(tuple(path))
+                            frame[2] = True
+                        elif w not in blocked:
+                            if len(path) < max_length:
+                                # Спускаемся в w, итератор текущей вершины продолжим позже
+                                path.append(w)
+                                blocked.add(w)
+                                stack.append([w, iter(adjacency[w]), False])
+                                break
+                            # Отсечение по длине: вершину нельзя блокировать,
+                            # через неё может проходить более короткий цикл
+                            frame[2] = True
+                    else:
+                        # Все соседи обработаны - возврат из вершины
+                        v, _, found = stack.pop()
+                        path.pop()
+
+                        if found:
+                            # Снимаем блокировку с v и всех, кто ждал её в B-списках
+                            pending = [v]
+                            while pending:
+                                u = pending.pop()
+                                if u in blocked:
+                                    blocked.discard(u)
+                                    pending.extend(blocked_by.pop(u, ()))
+                            if stack:
+                                stack[-1][2] = True
+                        else:
+                            for w in adjacency[v]:
+                                blocked_by[w].add(v)
+
+        return sorted(cycles)
 
     def print_cycle_analysis(self, analysis, cycle_num):
         """Вывод анализа цикла в консоль"""
@@ -162,8 +296,12 @@ class CraftingGraph:
             }
             data['cycles'].append(cycle_data)
 
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        if orjson is not None:
+            with open(filename, 'wb') as f:
+                f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+        else:
+            with open(filename, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
 
 
 class CycleAnalysis:
@@ -176,110 +314,72 @@ class CycleAnalysis:
         self.recipes = [graph.recipe_id_map[rid] for rid in cycle]
 
         self.total_duration = self._calculate_duration()
+        self._sort_duration = get_duration_value(self.total_duration)  # Ключ для --sort duration
         self.inputs_consumed = self._calculate_inputs()
         self.outputs_produced = self._calculate_outputs()
-        self.net_balance = self._calculate_balance()
-        self.is_self_sustaining = self._check_self_sustaining()
+        self.net_balance, self.is_self_sustaining = self._calculate_balance()
 
     def _calculate_duration(self):
         """Общее время цикла"""
         mode = self.config.get('duration_mode', 'range')
 
+        total_min = sum(recipe['duration_min'] for recipe in self.recipes)
+        total_max = sum(recipe['duration_max'] for recipe in self.recipes)
+        has_range = any(recipe['has_range'] for recipe in self.recipes)
+
         if mode == 'range':
             # Возвращаем {min: X, max: Y} для диапазонов
-            total_min = 0
-            total_max = 0
-            has_range = False
-
-            for recipe in self.recipes:
-                duration = recipe['duration']
-                if isinstance(duration, dict):
-                    total_min += duration['min']
-                    total_max += duration['max']
-                    has_range = True
-                else:
-                    total_min += duration
-                    total_max += duration
-
             return {'min': total_min, 'max': total_max} if has_range else total_min
-
         elif mode == 'avg':
             # Среднее для диапазонов
-            total = 0
-            for recipe in self.recipes:
-                duration = recipe['duration']
-                if isinstance(duration, dict):
-                    total += (duration['min'] + duration['max']) / 2
-                else:
-                    total += duration
-            return total
-
-        elif mode in ('min', 'max'):
-            # Минимум или максимум для диапазонов
-            total = 0
-            for recipe in self.recipes:
-                duration = recipe['duration']
-                if isinstance(duration, dict):
-                    total += duration[mode]
-                else:
-                    total += duration
-            return total
+            return (total_min + total_max) / 2 if has_range else total_min
+        elif mode == 'min':
+            return total_min
+        elif mode == 'max':
+            return total_max
 
         return 0
 
     def _calculate_inputs(self):
-        """Все потребляемые предметы"""
-        inputs = defaultdict(int)
+        """Все потребляемые предметы (суммы посчитаны по рецептам в графе)"""
+        inputs = Counter()
         for recipe in self.recipes:
-            for item in recipe['inputs']:
-                if not item.get('consumable', True):
-                    continue
-
-                name = item['name']
-                qty = item['quantity']
-                inputs[name] += qty
+            inputs.update(recipe['_consumed'])
         return dict(inputs)
 
     def _calculate_outputs(self):
         """Все производимые предметы"""
-        outputs = defaultdict(int)
+        outputs = Counter()
         for recipe in self.recipes:
-            output = recipe['output']
-            name = output['name']
-            qty = output['quantity']
-            outputs[name] += qty
+            outputs.update(recipe['_produced'])
         return dict(outputs)
 
     def _calculate_balance(self):
-        """Чистый баланс (выход - вход)"""
-        all_items = set(self.inputs_consumed.keys()) | set(self.outputs_produced.keys())
-        balance = {}
-
-        for item in all_items:
-            consumed = self.inputs_consumed.get(item, 0)
-            produced = self.outputs_produced.get(item, 0)
-            net = produced - consumed
-
-            if net != 0:
-                balance[item] = net
-
-        return balance
-
-    def _check_self_sustaining(self):
         """
+        Чистый баланс (выход - вход) и признак самовоспроизводства за один проход.
+
         Самовоспроизводящийся цикл:
         1. Все входы производятся внутри (баланс >= 0)
         2. Есть хотя бы один предмет с профитом (баланс > 0)
         """
+        totals = Counter()
+        for recipe in self.recipes:
+            totals.update(recipe['_delta'])
+
+        balance = {}
+        has_deficit = False  # Нужны внешние ресурсы
         has_profit = False
 
-        for item, balance in self.net_balance.items():
-            if balance < 0:
-                return False  # Нужны внешние ресурсы
-            if balance > 0:
+        for item, net in totals.items():
+            if net < 0:
+                has_deficit = True
+            elif net > 0:
                 has_profit = True
+            else:
+                continue
+            balance[item] = net
 
-        return has_profit
+        return balance, has_profit and not has_deficit
 
 
 class AnalysisConfig:
@@ -340,10 +440,17 @@ class AnalysisConfig:
 def format_duration(duration):
     """Форматирование duration"""
     if isinstance(duration, dict):
-        return f"{format_seconds(duration['min'])} - {format_seconds(duration['max'])}"
+        # dict не хэшируется - кэшируем по паре (min, max)
+        return _format_range(duration['min'], duration['max'])
     return format_seconds(duration)
 
 
+@lru_cache(maxsize=4096)
+def _format_range(min_seconds, max_seconds):
+    return f"{format_seconds(min_seconds)} - {format_seconds(max_seconds)}"
+
+
+@lru_cache(maxsize=4096)
 def format_seconds(seconds):
     """Конвертация секунд в читаемый формат"""
     if not seconds:
@@ -371,6 +478,20 @@ def get_duration_value(duration):
     return duration
 
 
+def load_recipes(yaml_file):
+    """
+    Загружает рецепты из pickle-кэша (пишется parse_crafting_recipes.py),
+    если он не старее YAML; иначе - из самого YAML.
+    """
+    pickle_file = yaml_file.with_suffix('.pkl')
+    if pickle_file.exists() and pickle_file.stat().st_mtime >= yaml_file.stat().st_mtime:
+        with open(pickle_file, 'rb') as f:
+            return pickle.load(f)
+
+    with open(yaml_file, 'r', encoding='utf-8') as f:
+        return yaml.load(f, Loader=SafeLoader)
+
+
 def main():
     # Конфигурация
     config = AnalysisConfig.from_args()
@@ -384,8 +505,7 @@ def main():
         print("Запустите сначала: python parse_crafting_recipes.py")
         return
 
-    with open(yaml_file, 'r', encoding='utf-8') as f:
-        data = yaml.safe_load(f)
+    data = load_recipes(yaml_file)
 
     # Построение графа
     print("Построение графа...")
@@ -424,7 +544,7 @@ def main():
     elif config.sort_by == 'length':
         analyses.sort(key=lambda a: -len(a.cycle))
     elif config.sort_by == 'duration':
-        analyses.sort(key=lambda a: -get_duration_value(a.total_duration))
+        analyses.sort(key=attrgetter('_sort_duration'), reverse=True)
 
     # Вывод
     if config.output_format in ('console', 'both'):
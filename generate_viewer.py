@@ -1,16 +1,26 @@
 #!/usr/bin/env python3
 """Генерирует viewer.html из crafting_recipes.yaml и viewer_template.html"""
 
-import yaml
 import json
 import sys
 from pathlib import Path
 
+# Загрузка рецептов (pickle-кэш / YAML) и опциональный orjson - общие с анализатором
+from analyze_cycles import load_recipes, orjson
+
 # Настройка кодировки для Windows
 if sys.platform == 'win32':
     sys.stdout.reconfigure(encoding='utf-8')
 
 
+def to_json(data):
+    """Компактный JSON для встраивания в HTML"""
+    if orjson is not None:
+        # Ключи уровней станций - int, json.dumps приводит их к строкам сам
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
 def main():
     # Читаем YAML
     print("Загрузка crafting_recipes.yaml...")
@@ -21,12 +31,11 @@ def main():
         print("Запустите сначала: python parse_crafting_recipes.py")
         return
 
-    with open(yaml_file, 'r', encoding='utf-8') as f:
-        data = yaml.safe_load(f)
+    data = load_recipes(yaml_file)
 
     # Конвертируем в JSON
     print("Конвертация в JSON...")
-    json_data = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+    json_data = to_json(data)
 
     # Читаем cycle_analysis.json
     print("Загрузка cycle_analysis.json...")
@@ -38,7 +47,7 @@ def main():
     else:
         print("  Внимание: cycle_analysis.json не найден, вкладка циклов будет пустой")
 
-    cycles_json = json.dumps(cycles_data, ensure_ascii=False, separators=(',', ':'))
+    cycles_json = to_json(cycles_data)
 
     # Читаем шаблон
     print("Загрузка viewer_template.html...")
@@ -2,11 +2,19 @@ import yaml
 import re
 import os
 import sys
+import pickle
 import requests
 from pathlib import Path
-from bs4 import BeautifulSoup
+from functools import lru_cache
+from lxml import etree
 from urllib.parse import unquote
 
+# libyaml (C) заметно быстрее чистого Python эмиттера
+try:
+    from yaml import CDumper as Dumper
+except ImportError:
+    from yaml import Dumper
+
 # Настройка кодировки для Windows
 if sys.platform == 'win32':
     sys.stdout.reconfigure(encoding='utf-8')
@@ -16,6 +24,29 @@ WIKI_URL = 'https://escapefromtarkov.fandom.com/ru/wiki/%D0%9A%D1%80%D0%B0%D1%84
 CACHE_DIR = Path('workbench')
 CACHE_FILE = CACHE_DIR / 'page.html'
 
+# Регулярные выражения компилируются один раз при загрузке модуля
+_DURATION_RE = re.compile(r'(\d+)\s*(ч|мин|сек)')  # "1 ч", "58 мин", "40 сек"
+_UNIT_SECONDS = {'ч': 3600, 'мин': 60, 'сек': 1}
+_STATION_RE = re.compile(r'(.+?)\s+УР\s*(\d+)')
+_QTY_DELETE = str.maketrans('', '', 'x')
+
+# XPath-запросы тоже компилируются один раз, а не на каждую таблицу/строку
+_ROWS = etree.XPath('.//tr')
+_CELLS = etree.XPath('.//th')
+_LINKS = etree.XPath('.//a')
+_WIKI_LINKS = etree.XPath('.//a[starts-with(@href, "/ru/wiki/")]')
+_FIRST_WIKI_LINK = etree.XPath('(.//a[starts-with(@href, "/ru/wiki/")])[1]')
+_FILE_DESCRIPTION_LINK = etree.XPath(
+    '(.//a[contains(concat(" ", normalize-space(@class), " "), " mw-file-description ")])[1]'
+)
+_NEXT_LINK = etree.XPath('(descendant::a | following::a)[1]')  # Аналог bs4 find_next('a')
+# <small> и <span class="small"> одним обходом строки, в порядке документа
+_SMALL_BLOCKS = etree.XPath(
+    './/*[self::small or self::span[contains(concat(" ", normalize-space(@class), " "), " small ")]]'
+)
+_ICON_IMG = etree.XPath('(.//img[@data-src != ""])[1]')  # Пустой data-src - не иконка
+_GENERATOR_IMG = etree.XPath('(.//img[contains(@data-src, "Generator_Portrait.png")])[1]')
+
 
 def ensure_wiki_page():
     """
@@ -44,27 +75,13 @@ def ensure_wiki_page():
 
 
 def _convert_time_to_seconds(time_text):
-    """Конвертирует текст времени в секунды."""
-    hours = 0
-    minutes = 0
-    seconds = 0
-
-    # Парсим часы
-    h_match = re.search(r'(\d+)\s*ч', time_text)
-    if h_match:
-        hours = int(h_match.group(1))
-
-    # Парсим минуты
-    m_match = re.search(r'(\d+)\s*мин', time_text)
-    if m_match:
-        minutes = int(m_match.group(1))
+    """Конвертирует текст времени в секунды (один проход по строке)."""
+    values = {}
+    for match in _DURATION_RE.finditer(time_text):
+        # Учитываем первое вхождение каждой единицы
+        values.setdefault(match.group(2), int(match.group(1)))
 
-    # Парсим секунды
-    s_match = re.search(r'(\d+)\s*сек', time_text)
-    if s_match:
-        seconds = int(s_match.group(1))
-
-    return hours * 3600 + minutes * 60 + seconds
+    return sum(_UNIT_SECONDS[unit] * value for unit, value in values.items())
 
 
 def parse_duration_to_seconds(duration_text):
@@ -78,15 +95,22 @@ def parse_duration_to_seconds(duration_text):
     if not duration_text:
         return None
 
+    duration = _parse_duration(duration_text)
+    if isinstance(duration, tuple):
+        # Новый dict на каждый вызов: кэш не должен раздавать общий объект
+        return {'min': duration[0], 'max': duration[1]}
+    return duration
+
+
+@lru_cache(maxsize=4096)
+def _parse_duration(duration_text):
+    """Кэшируемый разбор duration; диапазон возвращается кортежем (min, max)."""
     # Проверяем диапазон
     if 'от' in duration_text and 'до' in duration_text:
         parts = duration_text.split('до')
         min_part = parts[0].replace('от', '').strip()
         max_part = parts[1].strip()
-        return {
-            'min': _convert_time_to_seconds(min_part),
-            'max': _convert_time_to_seconds(max_part)
-        }
+        return _convert_time_to_seconds(min_part), _convert_time_to_seconds(max_part)
 
     # Одиночное значение
     return _convert_time_to_seconds(duration_text)
@@ -100,7 +124,7 @@ def _parse_station_name_and_level(full_name):
     - "Верстак УР 1" → ("Верстак", 1)
     - "Биткоин ферма" → ("Биткоин ферма", 1)
     """
-    match = re.search(r'(.+?)\s+УР\s*(\d+)', full_name)
+    match = _STATION_RE.search(full_name)
     if match:
         base_name = match.group(1).strip()
         level = int(match.group(2))
@@ -108,116 +132,164 @@ def _parse_station_name_and_level(full_name):
     return full_name, 1
 
 
+def _text(element, separator=''):
+    """Текст элемента без пустых строк (аналог bs4 get_text(strip=True))."""
+    return separator.join(_stripped_strings(element))
+
+
+def _stripped_strings(element):
+    """Непустые текстовые фрагменты элемента, без пробелов по краям."""
+    return [s for s in (text.strip() for text in element.itertext()) if s]
+
+
+def _first(element, xpath):
+    """Первый результат скомпилированного XPath-запроса или None."""
+    found = xpath(element)
+    return found[0] if found else None
+
+
+def _parse_qty(code):
+    """Количество из <code>: "x3" → 3, нечисловое → 1, пустое → None."""
+    qty_text = _text(code).translate(_QTY_DELETE).strip()
+    if not qty_text:
+        return None
+    # isascii: isdigit() пропускает "²" и т.п., на которых int() падает
+    return int(qty_text) if qty_text.isascii() and qty_text.isdigit() else 1
+
+
+def _alt_is_generator(img):
+    """Иконка генератора, определенная по alt."""
+    alt = img.get('alt')
+    return bool(alt) and 'генератор' in alt.lower()
+
+
+def _iter_recipe_tables(page_file):
+    """
+    Потоково отдает таблицы рецептов вместе с текстом последних h3/h2 перед ними.
+    Новый h2 - новый раздел, h3 из предыдущего раздела к нему уже не относится.
+    Обработанная таблица и все, что было до нее, сразу освобождаются.
+    """
+    h2_name = h3_name = None
+    for _, element in etree.iterparse(str(page_file), events=('end',), tag=('h2', 'h3', 'table'),
+                                      html=True, encoding='utf-8'):
+        if element.tag == 'h2':
+            h2_name = _text(element).replace('[]', '')
+            h3_name = None
+        elif element.tag == 'h3':
+            h3_name = _text(element).replace('[]', '')
+        elif ' '.join(element.get('class', '').split()) == 'wikitable mw-collapsible':
+            yield h3_name, h2_name, element
+
+            # Таблица разобрана - чистим ее и предыдущие узлы, чтобы память не росла
+            element.clear()
+            parent = element.getparent()
+            while parent is not None and element.getprevious() is not None:
+                del parent[0]
+
+
 def parse_recipes():
     # Скачиваем страницу если нужно
     page_file = ensure_wiki_page()
 
-    with open(page_file, 'rb') as f:
-        soup = BeautifulSoup(f, 'html.parser', from_encoding='utf-8')
-
-    tables = soup.find_all('table', class_='wikitable mw-collapsible')
-
     stations = {}
 
-    for table in tables:
+    for h3_name, h2_name, table in _iter_recipe_tables(page_file):
         # Get station name from h3 (with level)
-        h3 = table.find_previous('h3')
-        if h3:
-            full_name = h3.get_text(strip=True).replace('[]', '')
-            base_name, level = _parse_station_name_and_level(full_name)
-        else:
+        if h3_name is not None:
+            base_name, level = _parse_station_name_and_level(h3_name)
+        elif h2_name is not None:
             # Fallback to h2
-            h2 = table.find_previous('h2')
-            if h2:
-                base_name = h2.get_text(strip=True).replace('[]', '')
-                level = 1
-            else:
-                base_name = "Unknown Station"
-                level = 1
+            base_name = h2_name
+            level = 1
+        else:
+            base_name = "Unknown Station"
+            level = 1
 
         # Initialize station structure
-        if base_name not in stations:
-            stations[base_name] = {
+        station = stations.get(base_name)
+        if station is None:
+            station = stations[base_name] = {
                 'base_name': base_name,
                 'wiki_link': None,
                 'levels': {}
             }
 
-        if level not in stations[base_name]['levels']:
-            stations[base_name]['levels'][level] = {
+        level_data = station['levels'].get(level)
+        if level_data is None:
+            level_data = station['levels'][level] = {
                 'icon_link': None,
                 'recipes': []
             }
 
-        rows = table.find_all('tr')[1:]  # Skip header row
-
+        rows = _ROWS(table)[1:]  # Skip header row
+
+        # Station wiki_link / icon_link: один раз на таблицу, из колонки станции первой строки рецепта
+        first_ths = next((ths for ths in map(_CELLS, rows) if len(ths) == 5), None)
+        center = first_ths[2].find('.//center') if first_ths is not None else None
+        if center is not None:
+            # Get wiki_link (station level) if not set yet
+            if station['wiki_link'] is None:
+                a_station = _first(center, _FIRST_WIKI_LINK)
+                if a_station is not None:
+                    station['wiki_link'] = 'https://escapefromtarkov.fandom.com' + a_station.get('href')
+
+            # Get icon_link for current level (level specific) if not set yet
+            if level_data['icon_link'] is None:
+                span_file = center.find('.//span[@typeof="mw:File/Frameless"]')
+                if span_file is not None:
+                    a_icon = _first(span_file, _FILE_DESCRIPTION_LINK)
+                    if a_icon is not None and a_icon.get('href'):
+                        level_data['icon_link'] = a_icon.get('href')
+
+        # Рецепты таблицы копятся локально и добавляются в уровень одним extend
+        local_recipes = []
+        append_recipe = local_recipes.append
         for row in rows:
-            ths = row.find_all('th')
+            ths = _CELLS(row)
             if len(ths) != 5:
                 continue
 
             input_th, arrow1, station_th, arrow2, output_th = ths
 
-            # Get station wiki_link from first row if not set yet
-            if stations[base_name]['wiki_link'] is None:
-                center = station_th.find('center')
-                if center:
-                    # Get wiki_link (station level)
-                    a_station = center.find('a', href=lambda x: x and x.startswith('/ru/wiki/'))
-                    if a_station:
-                        stations[base_name]['wiki_link'] = 'https://escapefromtarkov.fandom.com' + a_station['href']
-
-            # Get icon_link for current level from first row if not set yet
-            if stations[base_name]['levels'][level]['icon_link'] is None:
-                center = station_th.find('center')
-                if center:
-                    # Get icon_link (level specific)
-                    span_file = center.find('span', attrs={'typeof': 'mw:File/Frameless'})
-                    if span_file:
-                        a_icon = span_file.find('a', class_='mw-file-description')
-                        if a_icon and a_icon.get('href'):
-                            stations[base_name]['levels'][level]['icon_link'] = a_icon['href']
-
             # Parse inputs
             # Find all wiki links in input column - they represent items
             inputs = []
-            for a_wiki in input_th.find_all('a', href=lambda x: x and x.startswith('/ru/wiki/')):
+            for a_wiki in _WIKI_LINKS(input_th):
                 item = {}
-                name = a_wiki.get('title') or a_wiki.get_text(strip=True)
+                name = a_wiki.get('title') or _text(a_wiki)
                 if not name:
                     continue
 
                 item['name'] = name
-                item['wiki_link'] = 'https://escapefromtarkov.fandom.com' + a_wiki['href']
+                item['wiki_link'] = 'https://escapefromtarkov.fandom.com' + a_wiki.get('href')
 
                 # Find icon - look for preceding img in the same parent
-                parent = a_wiki.parent
-                img = None
-                # Try to find img before this link
-                for sibling in parent.find_all('img'):
-                    if sibling.find_next('a') == a_wiki:
-                        img = sibling
-                        break
-                if img and img.get('data-src'):
-                    item['icon_link'] = img['data-src']
-
-                # Find code - look for preceding code in the same parent
-                code = None
-                for sibling in parent.find_all('code'):
-                    # Code should be between img and link
-                    if sibling.find_next('a') == a_wiki:
-                        code = sibling
-                        break
-
-                if code:
-                    qty_text = code.get_text(strip=True).replace('x', '').strip()
+                parent = a_wiki.getparent()
+                # Try to find img before this link (first img with data-src whose next link is this one)
+                img = next(
+                    (sibling for sibling in parent.iter('img')
+                     if sibling.get('data-src') and _first(sibling, _NEXT_LINK) is a_wiki),
+                    None
+                )
+                if img is not None:
+                    item['icon_link'] = img.get('data-src')
+
+                # Find code - look for preceding code in the same parent (between img and link)
+                code = next(
+                    (sibling for sibling in parent.iter('code')
+                     if _first(sibling, _NEXT_LINK) is a_wiki),
+                    None
+                )
+
+                if code is not None:
+                    qty = _parse_qty(code)
                     # Check for tool icon (wrench)
-                    tool_icon = code.find('img', attrs={'data-image-name': 'Blue_wrench_icon.png'})
-                    if tool_icon or not qty_text:
+                    tool_icon = code.find('.//img[@data-image-name="Blue_wrench_icon.png"]')
+                    if tool_icon is not None or qty is None:
                         item['quantity'] = 0
                         item['consumable'] = False
                     else:
-                        item['quantity'] = int(qty_text) if qty_text.isdigit() else 1
+                        item['quantity'] = qty
                         item['consumable'] = True
                 else:
                     item['quantity'] = 1
@@ -227,27 +299,27 @@ def parse_recipes():
 
             # Parse duration from station column
             duration = None
-            b_tag = station_th.find('b')
-            if b_tag:
-                duration_text = b_tag.get_text(separator=' ', strip=True)
+            b_tag = station_th.find('.//b')
+            if b_tag is not None:
+                duration_text = _text(b_tag, separator=' ')
                 duration = parse_duration_to_seconds(duration_text)
 
             # Parse output
             output = {}
-            a_wiki = output_th.find('a', href=lambda x: x and x.startswith('/ru/wiki/'))
-            if a_wiki:
-                name = a_wiki.get('title') or a_wiki.get_text(strip=True)
+            a_wiki = _first(output_th, _FIRST_WIKI_LINK)
+            if a_wiki is not None:
+                name = a_wiki.get('title') or _text(a_wiki)
                 if name:
                     output['name'] = name
-                    output['wiki_link'] = 'https://escapefromtarkov.fandom.com' + a_wiki['href']
+                    output['wiki_link'] = 'https://escapefromtarkov.fandom.com' + a_wiki.get('href')
                     # Add icon_link from data-src
-                    img = output_th.find('img')
-                    if img and img.get('data-src'):
-                        output['icon_link'] = img['data-src']
-            code = output_th.find('code')
-            if code:
-                qty = code.get_text(strip=True).replace('x', '').strip()
-                output['quantity'] = int(qty) if qty.isdigit() else 1
+                    img = _first(output_th, _ICON_IMG)
+                    if img is not None:
+                        output['icon_link'] = img.get('data-src')
+            code = output_th.find('.//code')
+            if code is not None:
+                qty = _parse_qty(code)
+                output['quantity'] = qty if qty is not None else 1
             else:
                 output['quantity'] = 1
 
@@ -256,20 +328,24 @@ def parse_recipes():
 
             # Check for requirements
             requirements = []
-            small = row.find('small') or row.find('span', class_='small')
-            if small:
+            # <small> в приоритете, иначе первый <span class="small">
+            blocks = _SMALL_BLOCKS(row)
+            small = next((block for block in blocks if block.tag == 'small'), blocks[0] if blocks else None)
+            if small is not None:
                 # Check for electricity requirement
-                generator_img = small.find('img', attrs={'data-src': lambda x: x and 'Generator_Portrait.png' in x})
-                if not generator_img:
-                    generator_img = small.find('img', alt=lambda x: x and 'генератор' in x.lower() if x else False)
-
-                full_text = small.get_text(separator=' ', strip=True).lower()
-                if generator_img or 'требуется в течение всего процесса' in full_text or 'необходимо на протяжении всего процесса' in full_text:
+                generator_img = _first(small, _GENERATOR_IMG)
+                if generator_img is None:
+                    generator_img = next(filter(_alt_is_generator, small.iter('img')), None)
+
+                # Текст блока собирается один раз: для проверок, префикса и описания
+                text_parts = _stripped_strings(small)
+                small_text = ' '.join(text_parts)
+                full_text = small_text.lower()
+                if generator_img is not None or 'требуется в течение всего процесса' in full_text or 'необходимо на протяжении всего процесса' in full_text:
                     requirements.append({'type': 'electricity_required'})
 
-                # Get all links and text
-                links = small.find_all('a')
-                text_parts = [s.strip() for s in small.stripped_strings]
+                # Get all links
+                links = _LINKS(small)
 
                 if links and text_parts:
                     req = {}
@@ -279,36 +355,36 @@ def parse_recipes():
                     if 'во время прохождения' in prefix:
                         req['type'] = 'during_quest'
                         if links:
-                            req['quest'] = links[0].get_text(strip=True)
-                            req['quest_link'] = 'https://escapefromtarkov.fandom.com' + links[0]['href']
+                            req['quest'] = _text(links[0])
+                            req['quest_link'] = 'https://escapefromtarkov.fandom.com' + links[0].get('href')
                     elif 'после принятия квеста' in prefix:
                         req['type'] = 'quest_accepted'
                         # Format: "После принятия квеста" + NPC_link + Quest_link
                         if len(links) >= 2:
-                            req['npc'] = links[0].get_text(strip=True)
-                            req['npc_link'] = 'https://escapefromtarkov.fandom.com' + links[0]['href']
-                            req['quest'] = links[1].get_text(strip=True)
-                            req['quest_link'] = 'https://escapefromtarkov.fandom.com' + links[1]['href']
+                            req['npc'] = _text(links[0])
+                            req['npc_link'] = 'https://escapefromtarkov.fandom.com' + links[0].get('href')
+                            req['quest'] = _text(links[1])
+                            req['quest_link'] = 'https://escapefromtarkov.fandom.com' + links[1].get('href')
                         elif len(links) == 1:
-                            req['quest'] = links[0].get_text(strip=True)
-                            req['quest_link'] = 'https://escapefromtarkov.fandom.com' + links[0]['href']
+                            req['quest'] = _text(links[0])
+                            req['quest_link'] = 'https://escapefromtarkov.fandom.com' + links[0].get('href')
                     elif 'после выполнения квеста' in prefix:
                         req['type'] = 'quest_completed'
                         if links:
-                            req['quest'] = links[0].get_text(strip=True)
-                            req['quest_link'] = 'https://escapefromtarkov.fandom.com' + links[0]['href']
+                            req['quest'] = _text(links[0])
+                            req['quest_link'] = 'https://escapefromtarkov.fandom.com' + links[0].get('href')
                     elif prefix.startswith('после'):
                         req['type'] = 'after_quest'
                         if links:
-                            req['quest'] = links[0].get_text(strip=True)
-                            req['quest_link'] = 'https://escapefromtarkov.fandom.com' + links[0]['href']
+                            req['quest'] = _text(links[0])
+                            req['quest_link'] = 'https://escapefromtarkov.fandom.com' + links[0].get('href')
                     else:
                         # Generic requirement - только если это не electricity
-                        if not (generator_img or 'требуется в течение всего процесса' in full_text):
+                        if not (generator_img is not None or 'требуется в течение всего процесса' in full_text):
                             req['type'] = 'other'
-                            req['description'] = small.get_text(separator=' ', strip=True)
+                            req['description'] = small_text
                             if links:
-                                req['link'] = 'https://escapefromtarkov.fandom.com' + links[0]['href']
+                                req['link'] = 'https://escapefromtarkov.fandom.com' + links[0].get('href')
 
                     if req:
                         requirements.append(req)
@@ -322,14 +398,20 @@ def parse_recipes():
             if requirements:
                 recipe['requirements'] = requirements
 
-            stations[base_name]['levels'][level]['recipes'].append(recipe)
+            append_recipe(recipe)
+
+        level_data['recipes'].extend(local_recipes)
 
     return stations
 
 if __name__ == '__main__':
     stations = parse_recipes()
     with open('crafting_recipes.yaml', 'w', encoding='utf-8') as f:
-        yaml.dump(stations, f, allow_unicode=True, default_flow_style=False, sort_keys=False)
+        yaml.dump(stations, f, Dumper=Dumper, allow_unicode=True, default_flow_style=False, sort_keys=False)
+
+    # Бинарная копия для analyze_cycles.py / generate_viewer.py (грузится быстрее YAML)
+    with open('crafting_recipes.pkl', 'wb') as f:
+        pickle.dump(stations, f, protocol=pickle.HIGHEST_PROTOCOL)
 
     # Count total recipes across all stations and levels
     total_recipes = sum(
@@ -339,12 +421,10 @@ if __name__ == '__main__':
     )
     print(f"Parsed {total_recipes} recipes in {len(stations)} stations")
 
-    # Debug: load YAML and print
-    with open('crafting_recipes.yaml', 'r', encoding='utf-8') as f:
-        loaded = yaml.safe_load(f)
-    if loaded:
-        first_station_name = list(loaded.keys())[0]
-        first_station = loaded[first_station_name]
+    # Debug (DEBUG_PARSE=1): print from the in-memory data (same structure as the YAML)
+    if stations and os.environ.get('DEBUG_PARSE'):
+        first_station_name = list(stations.keys())[0]
+        first_station = stations[first_station_name]
         print(f"\nFirst station: {first_station_name}")
         print(f"  base_name: {first_station.get('base_name')}")
         print(f"  wiki_link: {first_station.get('wiki_link')}")